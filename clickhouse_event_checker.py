@@ -7,24 +7,93 @@
 """
 
 import os
-import time
-from datetime import datetime, timedelta
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote_plus, urlencode
 import json
+import logging
 import sqlite3 as sql
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import pandas as pd
 
 import clickhouse_connect
+from clickhouse_connect.driver.httputil import get_pool_manager
 
 from config import Configuration as cfg
 from logger import get_cls_logger
 
 __version__ = "0.3.0"
 
+# Read once at import, schema is applied on every cache db connection
+_SCHEMA_SQL = Path(cfg.SCHEMA_FILE).read_text(encoding="utf-8")
+
+
+def connect_db() -> sql.Connection:
+    """
+    Open cache db connection in autocommit mode and tune it for
+    batch writes: WAL journal with relaxed syncing, so a commit
+    costs a single fsync and readers don't block the writer,
+    in-memory temp storage and memory-mapped reads. Dirty pages are
+    kept in the page cache until commit instead of being spilled.
+    Busy timeout is set by ``timeout``. Tables and indexes are
+    created if not exist.
+    """
+    con = sql.connect(cfg.DB_FILE, timeout=10, isolation_level=None)
+    con.executescript(
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA temp_store=MEMORY;"
+        "PRAGMA cache_size=-65536;"
+        "PRAGMA cache_spill=OFF;"
+        "PRAGMA mmap_size=268435456;"
+    )
+    create_db_if_not_exists(con)
+    return con
+
+
+def create_db_if_not_exists(con: sql.Connection) -> None:
+    """Create SQLite database tables and indexes if not exist."""
+    with con:
+        db = con.cursor()
+        try:
+            db.executescript(_SCHEMA_SQL)
+        except sql.IntegrityError:
+            # Cache created before the unique index was added to the schema,
+            # drop duplicates left by overlapping runs so the index builds
+            con.rollback()
+            db.execute(
+                "DELETE FROM cachetab WHERE id NOT IN "
+                "(SELECT min(id) FROM cachetab GROUP BY af_sub1, event_name)"
+            )
+            db.executescript(_SCHEMA_SQL)
+        # Cache of previous versions keeps event_time as text, convert it
+        # to unix epoch. Text sorts after numbers, so once converted
+        # this is a single index probe
+        db.execute(
+            "UPDATE cachetab SET event_time = CAST(strftime('%s', event_time) "
+            "AS INTEGER) WHERE event_time >= ''"
+        )
+
 
 class ClickHouseConnector:
     """Class to connect ClickHouse DWH and fetch events."""
 
+    __slots__ = (
+        "host",
+        "user",
+        "password",
+        "port",
+        "pool_mgr",
+        "client",
+        "query_str",
+        "con",
+        "prev_last_created",
+        "last_created",
+    )
+
     logger = get_cls_logger(__qualname__)
     json_file_path = cfg.JSON_FILE
 
@@ -37,243 +106,361 @@ class ClickHouseConnector:
         self.password = kwargs.get("password") or ""
         self.port = kwargs.get("port") or ""
 
+        # Own pool instead of the library-wide default, so it is sized
+        # explicitly and its sockets are released on close
+        self.pool_mgr = get_pool_manager(maxsize=cfg.CLICKHOUSE_POOL_SIZE, num_pools=1)
         self.client = clickhouse_connect.get_client(
-            host=self.host, user=self.user, password=self.password, port=self.port
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            port=self.port,
+            pool_mgr=self.pool_mgr,
         )
 
         self.query_str = """SELECT created, event_time, event_name, af_sub1
-            FROM analytics.appsflyer_export FINAL
+            FROM analytics.appsflyer_export
             WHERE media_source = 'Popunder' 
-                AND created > {prev_last_created:datetime}
+                AND created > toDateTime({prev_last_created:UInt32})
                 AND event_name IN ('install', 'af_start_trial', 'af_subscribe', 'trial_renewal_cancelled')
-            ORDER BY event_time DESC"""
+            ORDER BY event_time DESC
+            LIMIT 1 BY event_name, af_sub1"""
 
-        # Check if the JSON file exists
+        self.con = connect_db()
+        self.prev_last_created = self._load_prev_last_created()
+        self.last_created = None
+        self.logger.debug("Make an instance of %s class", self.__class__.__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes connections.
+        """
+        self.client.close()
+        self.pool_mgr.clear()
+        self.con.close()
+
+    def _load_prev_last_created(self) -> int:
+        """
+        Load the last created date of previous call from cache db
+        as unix epoch. Falls back to the JSON file of previous versions,
+        then to a week ago.
+        """
+        row = self.con.execute(
+            "SELECT value FROM meta WHERE key='prev_last_created'"
+        ).fetchone()
+        if row is not None and row[0].isdigit():
+            return int(row[0])
+        if row is not None:
+            # ISO string written by previous versions
+            return self._from_iso(row[0])
         if os.path.exists(self.json_file_path):
-            # Read the existing JSON file
             with open(self.json_file_path, "r", encoding="utf-8") as file:
                 stored_values = json.load(file)
-                self.prev_last_created = datetime.fromisoformat(
-                    stored_values.get("prev_last_created", 0)
-                )
-        else:
-            self.prev_last_created = datetime.now() - timedelta(weeks=1)
-        self.logger.debug("Make an instance of %s class", self.__class__.__name__)
+                return self._from_iso(stored_values.get("prev_last_created"))
+        return int((datetime.now(timezone.utc) - timedelta(weeks=1)).timestamp())
 
-    def __del__(self):
+    def _from_iso(self, value: str) -> int:
         """
-        Destructor func, closes connection.
+        Convert ISO date of previous versions to unix epoch.
+        Naive dates were bound to the query as server local time.
         """
-        self.client.close()
+        date = datetime.fromisoformat(value)
+        if date.tzinfo is None:
+            date = self.client.server_tz.localize(date)
+        return int(date.timestamp())
 
     def fetch_new_events(self) -> pd.DataFrame:
         """
         Fetches new events from ClickHouse DWH.
+        Result is read column-wise straight into a DataFrame.
+        The new watermark is kept in ``last_created`` as unix epoch,
+        it's saved by ``EventProcessor`` together with the events.
         """
         parameters = {"prev_last_created": self.prev_last_created}
-        result = self.client.query(self.query_str, parameters=parameters)
-        df = pd.DataFrame(result.result_rows, columns=result.column_names)
+        df = self.client.query_df(self.query_str, parameters=parameters)
         if df.empty:
             return pd.DataFrame()
-        with open(self.json_file_path, "w", encoding="utf-8") as file:
-            json.dump({"prev_last_created": str(df["created"].max())}, file)
+        df["event_name"] = df["event_name"].astype("category")
+        # Plain numpy reduction on the raw datetime64 column, values
+        # are UTC for both naive and tz-aware columns
+        last_created = df["created"].values.max()
+        self.last_created = int(last_created.astype("datetime64[s]").astype("int64"))
         return df
 
 
 class EventProcessor:
     """Class for processing events."""
 
+    __slots__ = (
+        "events_df",
+        "session",
+        "executor",
+        "pending",
+        "con",
+        "last_created",
+    )
+
     BASE_URL = cfg.BASE_URL
     logger = get_cls_logger(__qualname__)
 
+    # Same statement text on every call, so sqlite reuses the prepared statement
+    INSERT_STMT = (
+        "INSERT OR IGNORE INTO cachetab (date, event_time, event_name, af_sub1) "
+        "VALUES (?, ?, ?, ?)"
+    )
+    SELECT_STMT = "SELECT af_sub1 FROM cachetab WHERE event_name=? AND af_sub1 IN ({})"
+    SELECT_CHUNK = 500  # Bound params per lookup, well below sqlite limit
+    DELETE_STMT = "DELETE FROM cachetab WHERE af_sub1=?"
+    DELETE_OLD_STMT = "DELETE FROM cachetab WHERE event_time < ?"
+    META_STMT = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+
+    # Event name in DWH, cnv_status and number of event flag param,
+    # requests of one af_sub1 id are sent one after another in this order
+    EVENT_MAP = (
+        ("install", "install", 1),
+        ("af_subscribe", "trial_converted", 4),
+        ("af_start_trial", "trial_started", 2),
+        ("trial_renewal_cancelled", "trial_renewal_cancelled", 6),
+    )
+
     def __init__(self, **kwargs):
         """
         Constructor func, gets events DataFrame and makes an instance.
         Trying to connect db or creating it if not exists.
         """
         self.events_df = kwargs.get("events")
-        self.install = self.events_df[self.events_df["event_name"] == "install"]
-        self.trial = self.events_df[self.events_df["event_name"] == "af_start_trial"]
-        self.trial_cancelled = self.events_df[
-            self.events_df["event_name"] == "trial_renewal_cancelled"
-        ]
-        self.activation = self.events_df[self.events_df["event_name"] == "af_subscribe"]
+        self.last_created = kwargs.get("last_created")
         self.logger.debug("Make an instance of %s class", self.__class__.__name__)
 
-        self._create_db_if_not_exists()
+        self.session = requests.Session()
+        self.session.mount(
+            self.BASE_URL,
+            HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=cfg.WORKERS,
+                max_retries=Retry(
+                    total=cfg.RETRIES,
+                    backoff_factor=cfg.BACKOFF_FACTOR,
+                    backoff_jitter=cfg.BACKOFF_JITTER,
+                    backoff_max=cfg.BACKOFF_MAX,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset({"GET"}),
+                    respect_retry_after_header=True,
+                ),
+            ),
+        )
 
-    def _create_db_if_not_exists(self):
-        """Create SQLite database if not exists."""
-        with sql.connect(cfg.DB_FILE, timeout=10) as con:
-            db = con.cursor()
-            try:
-                self.logger.debug("Try to connect sqlite db")
-                db.execute("SELECT id FROM cachetab")
-            except sql.OperationalError:
-                self.logger.debug("Sqlite db not exists, creating it from schema")
-                db.executescript(open(cfg.SCHEMA_FILE, "rt", encoding="utf-8").read())
-
-    def _save_event_to_db(
-        self, event_time: datetime, event_name: str, af_sub1: str
-    ) -> bool:
-        """
-        Save event to cache db.
-        """
-        payload = {
-            "date": datetime.now(),
-            "event_time": event_time,
-            "event_name": event_name,
-            "af_sub1": af_sub1,
-        }
-
-        with sql.connect(cfg.DB_FILE, timeout=10) as con:
-            db = con.cursor()
-            db.execute(
-                "SELECT id FROM cachetab WHERE af_sub1=:af_sub1 AND event_name=:event_name",
-                payload,
-            )
+        self.executor = ThreadPoolExecutor(max_workers=cfg.WORKERS)
+        self.pending = []
+        self.con = connect_db()
 
-            if len(db.fetchall()) == 0:
-                db.execute(
-                    "INSERT INTO cachetab (date, event_time, event_name, af_sub1)"
-                    "values (:date, :event_time, :event_name, :af_sub1)",
-                    payload,
-                )
-                try:
-                    con.commit()
-                    self.logger.debug(
-                        "New record (%s) inserted in db", payload["af_sub1"]
-                    )
-                    return True
-                except sql.OperationalError as err:
-                    self.logger.error("OOps: Operational Error: %s", err)
-                    return False
-            else:
-                self.logger.debug("Record has already in db, skipping")
-                return False
+    def __enter__(self):
+        return self
 
-    def remove_event_from_db(self, af_sub1: str) -> None:
-        """
-        Remove event from cache db.
-        """
-        with sql.connect(cfg.DB_FILE, timeout=10) as con:
-            db = con.cursor()
-            db.execute(
-                "DELETE FROM cachetab WHERE af_sub1=:af_sub1", {"af_sub1": af_sub1}
-            )
-            try:
-                con.commit()
-                self.logger.debug("Record (%s) removed from db", af_sub1)
-            except sql.OperationalError as err:
-                self.logger.error("OOps: Operational Error: %s", err)
-                return
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    def _process_new_events(self, events_df: pd.DataFrame) -> pd.DataFrame:
+    def close(self) -> None:
         """
-        Process and save new events to cache db.
+        Waits for running requests and closes connections.
         """
-        new_events_df = pd.DataFrame(columns=events_df.columns)
-        for index, row in events_df.iterrows():
-            if self._save_event_to_db(
-                row["event_time"], row["event_name"], row["af_sub1"]
-            ):
-                new_events_df.loc[len(new_events_df)] = row
-        return new_events_df
+        self.executor.shutdown()
+        self.session.close()
+        self.con.close()
 
-    def remove_old_events(self):
+    def _get_cached_keys(self, db: sql.Cursor, events_df: pd.DataFrame) -> set:
         """
-        Remove old events from cache db.
+        Look up which events of the batch are already in cache db.
+
+        :param db:
+            Cursor of the open transaction.
+        :param events_df:
+            DataFrame of events with ``event_name`` and ``af_sub1`` columns.
+        :return:
+            Returns a set of cached ``(event_name, af_sub1)`` pairs.
+        """
+        cached = set()
+        groups = events_df.groupby("event_name", sort=False, observed=True)["af_sub1"]
+        for event_name, ids in groups:
+            ids = ids.unique().tolist()
+            for i in range(0, len(ids), self.SELECT_CHUNK):
+                chunk = ids[i : i + self.SELECT_CHUNK]
+                db.execute(
+                    self.SELECT_STMT.format(",".join("?" * len(chunk))),
+                    (event_name, *chunk),
+                )
+                cached.update((event_name, af_sub1) for (af_sub1,) in db)
+        return cached
+
+    def _save_events_to_db(self, events_df: pd.DataFrame) -> list:
         """
-        week_ago = datetime.now() - timedelta(weeks=1)
-        with sql.connect(cfg.DB_FILE, timeout=10) as con:
-            db = con.cursor()
-            db.execute(
-                "DELETE FROM cachetab WHERE event_time < :week_ago",
-                {"week_ago": week_ago},
-            )
+        Save events to cache db in a single transaction, together with
+        the last created date of fetched events, if it's known.
+        So the next call fetches only events created after it,
+        and the date never moves past unsaved events.
+
+        :param events_df:
+            DataFrame of events with ``event_time``, ``event_name``
+            and ``af_sub1`` columns.
+        :return:
+            Returns a list of flags, one per event: True if the event
+            was inserted and False if it has already been in db.
+        """
+        date = datetime.now()
+        inserted = []
+        rows = zip(
+            # Unix epoch, values are UTC for both naive and tz-aware columns
+            events_df["event_time"]
+            .values.astype("datetime64[s]")
+            .astype("int64")
+            .tolist(),
+            events_df["event_name"].to_numpy(),
+            events_df["af_sub1"].to_numpy(),
+        )
+
+        with self.con:
+            db = self.con.cursor()
+            # Take the write lock before reading, so cached keys can't go stale
+            db.execute("BEGIN IMMEDIATE")
+            cached = self._get_cached_keys(db, events_df)
+            payloads = []
+            for event_time, event_name, af_sub1 in rows:
+                if (event_name, af_sub1) in cached:
+                    inserted.append(False)
+                    continue
+                payloads.append((date, event_time, event_name, af_sub1))
+                cached.add((event_name, af_sub1))
+                inserted.append(True)
+            db.executemany(self.INSERT_STMT, payloads)
+            if self.last_created is not None:
+                db.execute(self.META_STMT, ("prev_last_created", self.last_created))
             try:
-                con.commit()
-                self.logger.debug("Old records removed from db")
+                self.con.commit()
+                self.logger.debug(
+                    "New records (%s) inserted in db, %s have already been in db",
+                    sum(inserted),
+                    len(inserted) - sum(inserted),
+                )
+                return inserted
             except sql.OperationalError as err:
                 self.logger.error("OOps: Operational Error: %s", err)
-                return
-
-    def process_install_events(self):
-        """
-        Process install events.
-        """
-        self.install = self._process_new_events(self.install)
-        self.install_requests()
+                self.con.rollback()
+                return [False] * len(inserted)
 
-    def process_trial_events(self):
+    def remove_event_from_db(self, af_sub1: str) -> None:
         """
-        Process trial events.
+        Remove event from cache db.
         """
-        self.trial = self._process_new_events(self.trial)
-        self.trial_requests()
+        db = self.con.cursor()
+        try:
+            db.execute(self.DELETE_STMT, (af_sub1,))
+            self.logger.debug("Record (%s) removed from db", af_sub1)
+        except sql.OperationalError as err:
+            self.logger.error("OOps: Operational Error: %s", err)
+            return
 
-    def process_cancelled_trial_events(self):
-        """
-        Process cancelled trial events.
+    def remove_old_events(self):
         """
-        self.trial_cancelled = self._process_new_events(self.trial_cancelled)
-        self.cancel_trial_requests()
+        Remove old events from cache db and refresh planner statistics
+        if the table changed enough for it to matter.
+        """
+        week_ago = int((datetime.now(timezone.utc) - timedelta(weeks=1)).timestamp())
+        db = self.con.cursor()
+        try:
+            db.execute(self.DELETE_OLD_STMT, (week_ago,))
+            self.logger.debug("Old records removed from db")
+            db.execute("PRAGMA optimize")
+        except sql.OperationalError as err:
+            self.logger.error("OOps: Operational Error: %s", err)
+            return
 
-    def process_activation_events(self):
+    def process_events(self):
         """
-        Process activation events.
+        Save new events of all types to cache db in a single transaction
+        and send requests for them, event types as listed in ``EVENT_MAP``.
+        Events that have already been in db or have no af_sub1 are skipped.
         """
-        self.activation = self._process_new_events(self.activation)
-        self.activation_requests()
+        events_df = self.events_df
+        if events_df.empty:
+            return
+        # Checked before saving, so the batch is never cached unsent
+        no_id = events_df["af_sub1"].isna()
+        if no_id.any():
+            self.logger.error("Skip events without af_sub1: %s", int(no_id.sum()))
+            events_df = events_df[~no_id]
+        if events_df.empty:
+            return
+        new_events = events_df[self._save_events_to_db(events_df)]
+        groups = dict(list(new_events.groupby("event_name", sort=False, observed=True)))
+        urls = {}
+        for event_name, event_status, event_number in self.EVENT_MAP:
+            if event_name not in groups:
+                continue
+            # Constant params are encoded once, only cnv_id varies per request
+            url_template = f"{self.BASE_URL}?cnv_id={{}}&" + urlencode(
+                [("cnv_status", event_status), (f"event{event_number}", 1)]
+            )
+            for af_sub1 in groups[event_name]["af_sub1"].to_numpy(dtype=object):
+                urls.setdefault(af_sub1, []).append(
+                    url_template.format(quote_plus(str(af_sub1)))
+                )
+        self._fire_many(urls)
 
-    def install_requests(self):
+    def _fire_many(self, urls: dict) -> None:
         """
-        Send requests for install events.
-        """
-        self.send_event_requests("install", "install", 1)
+        Send GET requests for new events grouped by af_sub1 id.
+        Requests of one id are sent one after another, so its statuses
+        reach the tracker in ``EVENT_MAP`` order. Ids are queued to the
+        shared pool without waiting and run concurrently over the shared
+        session, at most ``cfg.WORKERS`` at a time. See ``wait_requests``.
 
-    def activation_requests(self):
-        """
-        Send requests for activation events.
+        :param urls:
+            dict Lists of URLs to request by af_sub1 id.
         """
-        self.send_event_requests("activation", "trial_converted", 4)
+        self.pending.extend(
+            (af_sub1, self.executor.submit(self._send_in_order, id_urls))
+            for af_sub1, id_urls in urls.items()
+        )
 
-    def trial_requests(self):
+    def _send_in_order(self, urls: list) -> list:
         """
-        Send requests for trial events.
-        """
-        self.send_event_requests("trial", "trial_started", 2)
+        Send GET requests one after another, a failed request
+        doesn't stop the next ones.
 
-    def cancel_trial_requests(self):
-        """
-        Send requests for cancelled trial events.
+        :param urls:
+            list URLs to request.
+        :return:
+            Returns a list of errors of failed requests.
         """
-        self.send_event_requests("trial_cancelled", "trial_renewal_cancelled", 6)
+        errors = []
+        for url in urls:
+            response, error = self._requests_call("GET", url=url)
+            if error is not None:
+                errors.append(error)
+        return errors
 
-    def send_event_requests(self, event_name, event_status, event_number):
+    def wait_requests(self) -> None:
         """
-        Send requests for specified event.
+        Wait for all sent requests to finish and log failed ones.
         """
-        events_df = getattr(self, event_name)
-        if events_df.shape[0] == 0:
-            return
-        url = self.BASE_URL
-        for af_sub1 in events_df["af_sub1"]:
-            params = [
-                ["cnv_id", af_sub1],
-                ["cnv_status", event_status],
-                [f"event{event_number}", 1],
-            ]
-            response, error = self._requests_call("GET", url=url, params=params)
-            if error is not None:
+        for af_sub1, future in self.pending:
+            for error in future.result():
                 self.logger.error(
                     "Error while transmiting event (%s): %s", af_sub1, error
                 )
-                continue
+        self.pending.clear()
 
     def _requests_call(self, verb: str, url: str, params=None, **kwargs) -> tuple:
         """
         Wraping func for requests with errors handling.
+        Transient errors (connection, timeouts, 429 and 5xx) are retried
+        with capped exponential backoff plus random jitter by the session
+        adapter, other client errors fail at once.
 
         :param verb:
             str Method of request ``get`` or ``post``.
@@ -286,82 +473,44 @@ class EventProcessor:
         """
         r: object = None
         error: str = None
-        retries: int = cfg.RETRIES  # default 10
-        delay: int = cfg.DELAY  # default 6
+        debug: bool = self.logger.isEnabledFor(logging.DEBUG)
 
-        for retry in range(retries):
-            try:
+        try:
+            if debug:
                 self.logger.debug("Try %s request %s", verb, url)
-                r = requests.request(verb, url, params=params)
-                r.raise_for_status()
+            r = self.session.request(verb, url, params=params, timeout=cfg.TIMEOUT)
+            r.raise_for_status()
+            if debug:
                 self.logger.debug(
                     "Get answer with status code: %s %s", r.status_code, r.reason
                 )
-                return r, error
-            except requests.exceptions.HTTPError as errh:
-                self.logger.error("Http Error: %s", errh)
-                error = errh
-                self.logger.debug(
-                    "Don't give up! Trying to reconnect, retry %s of %s",
-                    retry + 1,
-                    retries,
-                )
-                time.sleep(delay)
-            except requests.exceptions.ConnectionError as errc:
-                self.logger.error("Connection Error: %s", errc)
-                error = errc
-                self.logger.debug(
-                    "Don't give up! Trying to reconnect, retry %s of %s",
-                    retry + 1,
-                    retries,
-                )
-                time.sleep(delay)
-            except requests.exceptions.Timeout as errt:
-                self.logger.error("Timeout Error: %s", errt)
-                error = errt
-                self.logger.debug(
-                    "Don't give up! Trying to reconnect, retry %s of %s",
-                    retry + 1,
-                    retries,
-                )
-                time.sleep(delay)
-            except requests.exceptions.RequestException as err:
-                self.logger.error("OOps: Unexpected Error: %s", err)
-                error = err
-                self.logger.debug(
-                    "Don't give up! Trying to reconnect, retry %s of %s",
-                    retry + 1,
-                    retries,
-                )
-                time.sleep(delay)
+            return r, error
+        except requests.exceptions.RequestException as err:
+            self.logger.error("%s: %s", err.__class__.__name__, err)
+            error = err
 
-        return r, error
+        return None, error
 
 
 def main():
     """
     Main function.
     """
-    dwh = ClickHouseConnector(
+    with ClickHouseConnector(
         host=cfg.CLICKHOUSE_HOST,
         user=cfg.CLICKHOUSE_USER,
         password=cfg.CLICKHOUSE_PASS,
         port=cfg.CLICKHOUSE_PORT,
-    )
-
-    df = dwh.fetch_new_events()
-
-    del dwh
+    ) as dwh:
+        df = dwh.fetch_new_events()
+        last_created = dwh.last_created
 
     if not df.empty:
-        evs = EventProcessor(events=df)
-
-        evs.process_install_events()
-        evs.process_activation_events()
-        evs.process_trial_events()
-        evs.process_cancelled_trial_events()
+        with EventProcessor(events=df, last_created=last_created) as evs:
+            evs.process_events()
+            evs.wait_requests()
 
-        evs.remove_old_events()
+            evs.remove_old_events()
 
 
 if __name__ == "__main__":
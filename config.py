@@ -19,13 +19,18 @@ class Configuration:
 
     DEBUG = False
     RETRIES = 10
-    DELAY = 6
+    BACKOFF_FACTOR = 1.0
+    BACKOFF_JITTER = 0.5
+    BACKOFF_MAX = 60
+    TIMEOUT = (3.05, 30)
+    WORKERS = 16
 
     # DWH Credentials
     CLICKHOUSE_HOST = env.get("ENV_CLICKHOUSE_HOST")
     CLICKHOUSE_USER = env.get("ENV_CLICKHOUSE_USER")
     CLICKHOUSE_PASS = env.get("ENV_CLICKHOUSE_PASS")
     CLICKHOUSE_PORT = env.get("ENV_CLICKHOUSE_PORT")
+    CLICKHOUSE_POOL_SIZE = 4
 
     # URLs
     URL_SECRET = env.get("ENV_URL_SECRET")
@@ -1,9 +1,15 @@
 BEGIN TRANSACTION;
-CREATE TABLE cachetab (
+CREATE TABLE IF NOT EXISTS cachetab (
     id         INTEGER PRIMARY KEY AUTOINCREMENT,
     date       DATETIME,
-    event_time DATETIME,
+    event_time INTEGER,
     event_name TEXT,
     af_sub1    TEXT
 );
+CREATE TABLE IF NOT EXISTS meta (
+    key        TEXT PRIMARY KEY,
+    value      TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS cachetab_af_sub1_event_name ON cachetab (af_sub1, event_name);
+CREATE INDEX IF NOT EXISTS cachetab_event_time ON cachetab (event_time);
 COMMIT;
@@ -7,13 +7,31 @@
 """
 
 import logging
+from logging.handlers import MemoryHandler
 
 from config import Configuration as cfg
 
 
+class BufferedFileHandler(MemoryHandler):
+    """Memory handler which closes its target handler on close."""
+
+    def close(self):
+        """
+        Flushes buffered records and closes the target handler.
+        """
+        target = self.target
+        try:
+            super().close()
+        finally:
+            if target is not None:
+                target.close()
+
+
 def get_cls_logger(cls: str) -> object:
     """
     Logger config. Sets handler to a file, formater and logging level.
+    Records are buffered and written to the file in batches, errors
+    and interpreter exit flush the buffer.
 
     :param cls:
         str Name of class where logger calling.
@@ -27,6 +45,6 @@ def get_cls_logger(cls: str) -> object:
             "%(asctime)s %(name)-20s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S"
         )
         handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        logger.addHandler(BufferedFileHandler(capacity=1024, target=handler))
     logger.setLevel(logging.DEBUG if cfg.DEBUG else logging.INFO)
     return logger